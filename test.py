@@ -1,18 +1,47 @@
+import asyncio
+import atexit
+import base64
+import concurrent.futures
+import hashlib
 import json
+import multiprocessing
+import os
+import queue
 import re
+import sys
+import threading
 import time
+import urllib.request
+from collections import OrderedDict, deque
 from datetime import date, timedelta
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchWindowException, WebDriverException
+from selenium.common.exceptions import TimeoutException, NoSuchWindowException
+
+from websocket import create_connection, WebSocketTimeoutException
+
+import httpx
+
+# orjson parsea payloads grandes varias veces más rápido que el stdlib
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# pyarrow trae un writer CSV vectorizado en C; opcional
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
 
 
 # ----------------------------
@@ -34,92 +63,282 @@ MIN_FLIGHTS_PER_DAY = 5
 # Kayak ES
 BASE = "https://www.kayak.es/flights"
 
+# Fragmentos de URL de los XHR con resultados de vuelos
+XHR_KEYWORDS = ("flight", "horizon", "results", "search", "poll")
 
-def accept_cookies_kayak(driver):
-    """Acepta cookies con múltiples intentos"""
-    possible = [
-        (By.XPATH, "//button[contains(., 'Aceptar')]"),
-        (By.XPATH, "//button[contains(., 'Acepto')]"),
-        (By.XPATH, "//button[contains(., 'Accept')]"),
-        (By.CSS_SELECTOR, "button[aria-label*='Aceptar']"),
-        (By.CSS_SELECTOR, "button[aria-label*='Accept']"),
-        (By.ID, "didomi-notice-agree-button"),
-        (By.CSS_SELECTOR, "[data-testid='cookieBanner-acceptButton']"),
-    ]
-    
-    for by, sel in possible:
+# Sesión capturada (URL del XHR + cabeceras firmadas) para replay sin navegador
+SESSION_FILE = "kayak_session.json"
+
+# Caché en disco de resultados ya scrapeados (día + destino), con TTL.
+# Reejecutar el script dentro de la ventana no vuelve a tocar Kayak.
+CACHE_DIR = "scrape_cache"
+CACHE_TTL_SECONDS = 3600
+USE_CACHE = "--no-cache" not in sys.argv
+
+# Perfil y caché de disco de Chrome, persistentes entre runs
+# (subcarpeta por slot de worker: cada proceso del pool necesita su perfil
+# propio, pero el worker N de un run reusa el perfil del worker N del anterior)
+PROFILE_DIR = "chrome_profile_kayak"
+CHROME_CACHE_DIR = ".chrome_cache"
+
+# Recursos que el scraper nunca necesita: imágenes, fuentes, CSS y trackers.
+# Bloquearlos recorta varios MB de transferencia por página
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.avif", "*.ico",
+    "*.woff*", "*.ttf", "*.css",
+    "*.mp4", "*.webm", "*.mp3",
+    "*google-analytics*", "*doubleclick*", "*facebook*",
+]
+
+
+# ----------------------------
+# CDP directo por WebSocket
+# ----------------------------
+class CDPSession:
+    """Conexión CDP directa a Chrome, sin pasar por el shim HTTP de ChromeDriver
+
+    Un hilo lector desmultiplexa el WebSocket según llegan los frames:
+    respuestas de comandos a un dict por id, eventos a una cola. Nadie
+    duerme en cuantos de 200 ms esperando tráfico.
+    """
+
+    def __init__(self, ws_url: str):
+        self.ws = create_connection(ws_url, timeout=5)
+        self.ws.settimeout(0.2)
+        self._next_id = 0
+        self._events: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self._replies: Dict[int, Dict[str, Any]] = {}
+        self._reply_ready = threading.Event()
+        self._stop = threading.Event()
+        self._events_filter: Optional[Tuple[str, ...]] = None
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    def _read_loop(self):
+        """Hilo lector: corre hasta que se cierra la sesión"""
+        while not self._stop.is_set():
+            try:
+                raw = self.ws.recv()
+            except WebSocketTimeoutException:
+                continue
+            except Exception:
+                break
+            # El método viene al principio del frame: mirar solo la cabecera
+            flt = self._events_filter
+            if (flt is not None and raw.startswith('{"method"')
+                    and not any(m in raw[:64] for m in flt)):
+                continue
+            msg = _json_loads(raw)
+            if "id" in msg:
+                self._replies[msg["id"]] = msg
+                self._reply_ready.set()
+            else:
+                self._events.put(msg)
+
+    def send(self, method: str, params: Optional[Dict[str, Any]] = None) -> int:
+        """Envía un frame JSON-RPC y devuelve su id (sin esperar respuesta)"""
+        self._next_id += 1
+        self.ws.send(json.dumps({"id": self._next_id, "method": method, "params": params or {}}))
+        return self._next_id
+
+    def recv_event(self, timeout: float = 0.2,
+                   events_filter: Optional[Tuple[str, ...]] = None) -> Optional[Dict[str, Any]]:
+        """Saca el siguiente evento de la cola; None si no llega a tiempo
+
+        Con `events_filter`, el hilo lector descarta los eventos cuyo método
+        no aparezca en la tupla con un test de subcadena, sin parsear JSON.
+        """
+        self._events_filter = events_filter
         try:
-            btn = WebDriverWait(driver, 3).until(EC.element_to_be_clickable((by, sel)))
-            driver.execute_script("arguments[0].click();", btn)  # Click por JavaScript
-            time.sleep(1)
-            print("✓ Cookies aceptadas")
-            return True
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def pop_reply(self, cmd_id: int) -> Optional[Dict[str, Any]]:
+        """Recoge sin bloquear la respuesta de un comando lanzado con send"""
+        return self._replies.pop(cmd_id, None)
+
+    def command(self, method: str, params: Optional[Dict[str, Any]] = None,
+                timeout: float = 10.0) -> Dict[str, Any]:
+        """Envía un comando y espera su respuesta"""
+        cmd_id = self.send(method, params)
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            msg = self._replies.pop(cmd_id, None)
+            if msg is not None:
+                if "error" in msg:
+                    raise RuntimeError(f"CDP {method}: {msg['error']}")
+                return msg.get("result", {})
+            self._reply_ready.wait(timeout=0.05)
+            self._reply_ready.clear()
+        raise TimeoutException(f"CDP {method}: sin respuesta en {timeout}s")
+
+    def close(self):
+        self._stop.set()
+        try:
+            self.ws.close()
         except Exception:
-            continue
-    print("ℹ No se encontró botón de cookies")
-    return False
+            pass
+
+
+def attach_cdp(driver) -> CDPSession:
+    """Abre un WebSocket directo a la pestaña que controla Selenium"""
+    addr = driver.capabilities["goog:chromeOptions"]["debuggerAddress"]
+    with urllib.request.urlopen(f"http://{addr}/json", timeout=5) as resp:
+        targets = json.loads(resp.read())
+    page = next(t for t in targets if t.get("type") == "page")
+    cdp = CDPSession(page["webSocketDebuggerUrl"])
+    cdp.command("Page.enable")
+    cdp.command("Network.enable")
+    # La caché de disco persistente solo ayuda si no está deshabilitada
+    cdp.command("Network.setCacheDisabled", {"cacheDisabled": False})
+    cdp.command("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+    return cdp
+
+
+# Una vez aceptado el banner queda una cookie en el perfil persistente:
+# no hace falta volver a buscarlo en las páginas siguientes del proceso
+_cookies_done = False
+
+
+def accept_cookies_kayak(cdp: CDPSession) -> bool:
+    """Acepta cookies con un solo Runtime.evaluate (todos los selectores en un viaje)"""
+    global _cookies_done
+    if _cookies_done:
+        return True
+    js = """(function(){
+        var sels = [
+            "#didomi-notice-agree-button",
+            "[data-testid='cookieBanner-acceptButton']",
+            "button[aria-label*='Aceptar']",
+            "button[aria-label*='Accept']"
+        ];
+        for (var i = 0; i < sels.length; i++) {
+            var b = document.querySelector(sels[i]);
+            if (b) { b.click(); return true; }
+        }
+        var btns = document.querySelectorAll("button");
+        for (var j = 0; j < btns.length; j++) {
+            var t = (btns[j].textContent || "").trim();
+            if (/Acept|Accept/.test(t)) { btns[j].click(); return true; }
+        }
+        return false;
+    })()"""
+    try:
+        res = cdp.command("Runtime.evaluate", {"expression": js, "returnByValue": True})
+        ok = bool((res.get("result") or {}).get("value"))
+    except Exception:
+        ok = False
+    if ok:
+        _cookies_done = True
+        print("✓ Cookies aceptadas")
+    else:
+        print("ℹ No se encontró botón de cookies")
+    return ok
 
 
 # ----------------------------
 # Helpers: parsing
 # ----------------------------
+# Escáneres de una sola pasada: sin regex ni objetos match en el camino
+# caliente, que se recorre una vez por candidato del DOM/JSON
+_DIRECT_WORDS = ("direct", "nonstop", "sin escalas", "directo", "0")
+
+
 def parse_price(text: str) -> float:
-    """Parsea precio eliminando símbolos y formato español"""
-    t = text.replace("\u202f", " ").replace("€", "").replace(".", "").replace(",", ".").strip()
-    nums = re.findall(r"[\d.]+", t)
-    if not nums:
+    """Parsea precio en una pasada: quita millares, coma decimal española"""
+    buf = []
+    started = False
+    for ch in text:
+        if "0" <= ch <= "9":
+            buf.append(ch)
+            started = True
+        elif ch == ".":
+            # Separador de millar: se elimina sin cortar el grupo numérico
+            continue
+        elif ch == ",":
+            if started:
+                buf.append(".")
+        elif started:
+            break
+    if not buf:
         raise ValueError(f"Cannot parse price from: {text}")
-    return float(nums[0])
+    return float("".join(buf))
+
 
 def parse_duration_to_minutes(text: str) -> int:
-    """Convierte texto de duración a minutos"""
+    """Convierte texto de duración a minutos en una sola pasada"""
     t = text.lower().strip()
     h = 0
     m = 0
-    
-    # Patrones para horas
-    mh = re.search(r"(\d+)\s*h", t)
-    if mh:
-        h = int(mh.group(1))
-    
-    # Patrones para minutos
-    mm = re.search(r"(\d+)\s*m", t)
-    if mm:
-        m = int(mm.group(1))
-    
-    # Si no encuentra con patrones, intenta extraer números
+    nums = []  # todos los números, para el fallback sin unidades
+    i = 0
+    n = len(t)
+    while i < n:
+        if t[i].isdigit():
+            j = i
+            while j < n and t[j].isdigit():
+                j += 1
+            val = int(t[i:j])
+            nums.append(val)
+            # Mirar la unidad que sigue al número (saltando espacios)
+            k = j
+            while k < n and t[k] == " ":
+                k += 1
+            if k < n:
+                if t[k] == "h" and h == 0:
+                    h = val
+                elif t[k] == "m" and m == 0:
+                    m = val
+            i = j
+        else:
+            i += 1
+
+    # Sin unidades reconocidas: interpretar los números sueltos
     if h == 0 and m == 0:
-        nums = re.findall(r"\d+", t)
         if len(nums) == 1:
-            m = int(nums[0])
+            m = nums[0]
         elif len(nums) >= 2:
-            h = int(nums[0])
-            m = int(nums[1]) if len(nums) > 1 else 0
-    
+            h, m = nums[0], nums[1]
+
     total = h * 60 + m
     if total <= 0:
         # Valor por defecto si no se puede parsear
         return 120  # 2 horas por defecto
     return total
 
+
 def parse_stops(text: str) -> int:
-    """Parsea número de escalas"""
+    """Parsea número de escalas en una sola pasada"""
     t = text.lower().strip()
-    
-    # Vuelos directos
-    if any(word in t for word in ["direct", "nonstop", "sin escalas", "directo", "0"]):
+
+    # Vuelos directos: el caso común sale sin escanear números
+    if any(word in t for word in _DIRECT_WORDS):
         return 0
-    
-    # Buscar números
-    m = re.search(r"(\d+)\s*(escala|stop)", t)
-    if m:
-        return int(m.group(1))
-    
-    m2 = re.search(r"(\d+)", t)
-    if m2:
-        return int(m2.group(1))
-    
-    return 0  # Por defecto asumimos directo
+
+    first_num = None
+    i = 0
+    n = len(t)
+    while i < n:
+        if t[i].isdigit():
+            j = i
+            while j < n and t[j].isdigit():
+                j += 1
+            val = int(t[i:j])
+            if first_num is None:
+                first_num = val
+            k = j
+            while k < n and t[k] == " ":
+                k += 1
+            # "2 escalas" / "2 stops" manda sobre cualquier otro número
+            if t.startswith("escala", k) or t.startswith("stop", k):
+                return val
+            i = j
+        else:
+            i += 1
+
+    return first_num if first_num is not None else 0  # Por defecto asumimos directo
+
 
 def build_url(origin: str, dest: str, d: date) -> str:
     """Construye URL para Kayak"""
@@ -129,10 +348,18 @@ def build_url(origin: str, dest: str, d: date) -> str:
 # ----------------------------
 # Selenium setup
 # ----------------------------
-def make_driver() -> webdriver.Chrome:
-    """Configura Chrome con opciones anti-detección"""
+def make_driver(slot: int = 0) -> webdriver.Chrome:
+    """Configura Chrome con opciones anti-detección
+
+    `slot` es el índice estable del worker: fija qué perfil/caché persistente
+    usa este Chrome, de modo que cookies, DNS y TLS sobrevivan entre runs.
+    """
     opts = Options()
-    
+
+    # No esperar al evento load: con DOMContentLoaded basta, los resultados
+    # llegan por XHR y ya hay esperas explícitas para lo que haga falta
+    opts.page_load_strategy = "eager"
+
     # Opciones para evitar detección
     opts.add_argument("--window-size=1400,900")
     opts.add_argument("--disable-gpu")
@@ -141,206 +368,772 @@ def make_driver() -> webdriver.Chrome:
     opts.add_argument("--disable-blink-features=AutomationControlled")
     opts.add_argument("--lang=es")
     opts.add_argument(f"--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-    
+
     # Excluir switches que delatan automatización
     opts.add_experimental_option("excludeSwitches", ["enable-automation"])
     opts.add_experimental_option('useAutomationExtension', False)
-    
-    # Perfil persistente (opcional)
-    # opts.add_argument(r"--user-data-dir=./chrome_profile")
-    
+
+    # No cargar imágenes ni pedir notificaciones: el scraper solo lee texto/XHR
+    opts.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.default_content_setting_values.notifications": 2,
+    })
+
+    # Perfil y caché persistentes: cookies, DNS y TLS calientes entre runs
+    opts.add_argument(f"--user-data-dir={PROFILE_DIR}/worker{slot}")
+    opts.add_argument("--profile-directory=Default")
+    opts.add_argument(f"--disk-cache-dir={CHROME_CACHE_DIR}/worker{slot}")
+    opts.add_argument("--disk-cache-size=524288000")
+
     driver = webdriver.Chrome(options=opts)
     driver.set_page_load_timeout(45)
-    
-    # Ocultar webdriver
-    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-    
+
+    # Ocultar webdriver antes de que corra ningún script de la página
+    # (inyectado en cada documento nuevo: no hay carrera con la navegación)
+    driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
+        "source": "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
+    })
+
     return driver
 
 
 # ----------------------------
-# Extracción desde DOM (más fiable)
+# Captura de red vía CDP
 # ----------------------------
-def extract_flights_from_dom(driver, d: date, dest_name: str, limit: int) -> List[Dict[str, Any]]:
-    """Extrae vuelos directamente del DOM"""
+# Los únicos eventos que la captura necesita parsear
+_CAPTURE_EVENTS = ('"Network.requestWillBeSent"', '"Network.responseReceived"')
+
+
+def collect_network_json(cdp: CDPSession, d: date, dest_name: str,
+                         seconds: float = 12.0,
+                         idle: float = 1.5) -> Tuple[List[Any], List[Dict[str, Any]]]:
+    """Captura los cuerpos JSON de los XHR de resultados; sale en cuanto hay bastantes
+
+    Extrae incrementalmente según llega cada cuerpo y corta cuando ya hay
+    MIN_FLIGHTS_PER_DAY vuelos únicos. `seconds` es solo un tope máximo;
+    también salimos si la red lleva `idle` segundos en calma. Devuelve
+    (payloads, vuelos) para que el caller no tenga que re-extraer.
+    """
+    payloads = []
+    flights: List[Dict[str, Any]] = []
+    pending_bodies: Dict[int, str] = {}  # id de comando -> url
+    req_headers: Dict[str, Dict[str, str]] = {}  # url -> cabeceras de la petición
+    deadline = time.time() + seconds
+    last_activity = time.time()
+
+    while True:
+        now = time.time()
+        # Prórroga corta tras el deadline para no tirar cuerpos ya pedidos
+        # que siguen en vuelo: su coste ya está pagado
+        if now >= deadline and not (pending_bodies and now < deadline + 1.0
+                                    and len(flights) < MIN_FLIGHTS_PER_DAY):
+            break
+
+        # Recoger primero los cuerpos que el hilo lector ya tenga respondidos
+        got_body = False
+        for cmd_id in list(pending_bodies):
+            reply = cdp.pop_reply(cmd_id)
+            if reply is None:
+                continue
+            got_body = True
+            last_activity = time.time()
+            url = pending_bodies.pop(cmd_id)
+            if "result" not in reply:
+                continue
+            body = reply["result"].get("body", "")
+            # Trabajar en bytes de punta a punta: sin str intermedio del b64
+            if reply["result"].get("base64Encoded"):
+                raw = base64.b64decode(body)
+            else:
+                raw = body.encode("utf-8", errors="ignore")
+            body_hash = hashlib.sha1(raw).hexdigest()
+            try:
+                payloads.append((url, body_hash, _json_loads(raw)))
+            except Exception:
+                continue
+            # Cuerpo JSON válido: guardar URL+cabeceras para replay HTTP directo
+            if url in req_headers:
+                _save_xhr_session(url, req_headers[url])
+
+        if got_body:
+            # Extracción incremental: la caché por payload evita re-recorrer
+            # los árboles ya vistos, así que esto solo procesa lo recién llegado
+            flights = extract_flights_from_payloads(payloads, d, dest_name,
+                                                    MIN_FLIGHTS_PER_DAY)
+            if len(flights) >= MIN_FLIGHTS_PER_DAY:
+                break
+
+        msg = cdp.recv_event(timeout=0.05, events_filter=_CAPTURE_EVENTS)
+        if msg is None:
+            # Sin tráfico relevante: si ya tenemos algo y nada pendiente, salimos pronto
+            if payloads and not pending_bodies and time.time() - last_activity > idle:
+                break
+            continue
+
+        if msg.get("method") == "Network.requestWillBeSent":
+            req = msg["params"]["request"]
+            url = req.get("url", "")
+            if req.get("method") == "GET" and any(k in url.lower() for k in XHR_KEYWORDS):
+                req_headers[url] = req.get("headers", {})
+
+        elif msg.get("method") == "Network.responseReceived":
+            resp = msg["params"]["response"]
+            url = resp.get("url", "")
+            if any(k in url.lower() for k in XHR_KEYWORDS) and "json" in resp.get("mimeType", ""):
+                # Pedir el cuerpo inmediatamente, sin esperar la respuesta aquí
+                cmd_id = cdp.send("Network.getResponseBody",
+                                  {"requestId": msg["params"]["requestId"]})
+                pending_bodies[cmd_id] = url
+                last_activity = time.time()
+
+    return payloads, flights
+
+
+# ----------------------------
+# Vía rápida: replay HTTP del XHR, sin navegador
+# ----------------------------
+# Trozos reescribibles de la URL capturada: ruta MAD-XXX y fecha ISO
+_ROUTE_RE = re.compile(r"[A-Z]{3}-[A-Z]{3}")
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def _save_xhr_session(url: str, headers: Dict[str, str]) -> None:
+    """Persiste la URL del XHR y sus cabeceras (cookies incluidas) a disco"""
+    try:
+        with open(SESSION_FILE, "w") as fh:
+            json.dump({"url": url, "headers": headers}, fh)
+    except Exception:
+        pass
+
+
+def _load_xhr_session() -> Optional[Dict[str, Any]]:
+    """Lee la sesión capturada en un run anterior, si existe"""
+    try:
+        with open(SESSION_FILE) as fh:
+            return json.load(fh)
+    except Exception:
+        return None
+
+
+def _session_url_for(sess: Dict[str, Any], dest_code: str, d: date) -> str:
+    """Reescribe la ruta origen-destino y la fecha sobre la URL capturada"""
+    url = _ROUTE_RE.sub(f"{ORIGIN}-{dest_code}", sess["url"])
+    return _DATE_RE.sub(d.isoformat(), url)
+
+
+def _payload_rows_http(r, url: str, d: date, dest_name: str) -> List[Dict[str, Any]]:
+    """Valida una respuesta httpx y extrae sus vuelos (vacío si es challenge)"""
+    if r.status_code != 200 or "json" not in r.headers.get("content-type", ""):
+        return []
+    try:
+        data = _json_loads(r.content)
+    except Exception:
+        return []
+    body_hash = hashlib.sha1(r.content).hexdigest()
+    return extract_flights_from_payloads([(url, body_hash, data)], d, dest_name,
+                                         MIN_FLIGHTS_PER_DAY)
+
+
+async def fetch_all_http(tasks: List[Tuple[date, str, str]]) -> Dict[Tuple[date, str, str], List[Dict[str, Any]]]:
+    """Intenta resolver todo el lote vía replay HTTP concurrente (sin navegador)
+
+    Devuelve solo las tareas que llegaron al mínimo de vuelos; el resto
+    cae al pool de navegadores. Concurrencia acotada para no disparar el
+    anti-bot de Kayak.
+    """
+    results: Dict[Tuple[date, str, str], List[Dict[str, Any]]] = {}
+
+    # Primero el caché de disco: lo resuelto en la última hora no sale a la red
+    pending = []
+    for task in tasks:
+        d, dest_name, dest_code = task
+        cached = _load_cached_rows(dest_code, d)
+        if cached is not None and len(cached) >= MIN_FLIGHTS_PER_DAY:
+            results[task] = cached[:MIN_FLIGHTS_PER_DAY]
+        else:
+            pending.append(task)
+    if results:
+        print(f"✓ {len(results)} tareas servidas desde caché de disco")
+    if not pending:
+        return results
+
+    sess = _load_xhr_session()
+    if not sess:
+        return results
+
+    sem = asyncio.Semaphore(5)
+
+    async with httpx.AsyncClient(http2=True, timeout=20,
+                                 headers=sess.get("headers", {})) as client:
+
+        async def one(task):
+            d, dest_name, dest_code = task
+            url = _session_url_for(sess, dest_code, d)
+            async with sem:
+                try:
+                    r = await client.get(url)
+                except Exception:
+                    return
+            rows = _payload_rows_http(r, url, d, dest_name)
+            if len(rows) >= MIN_FLIGHTS_PER_DAY:
+                results[task] = rows[:MIN_FLIGHTS_PER_DAY]
+                _save_cached_rows(dest_code, d, results[task])
+
+        await asyncio.gather(*(one(t) for t in pending))
+
+    return results
+
+
+def fetch_day_destination_http(d: date, dest_name: str, dest_code: str) -> List[Dict[str, Any]]:
+    """Pide el XHR de resultados directamente con httpx, reescribiendo ruta y fecha
+
+    Solo funciona cuando un run previo con navegador capturó la sesión;
+    si Kayak devuelve un challenge anti-bot, devolvemos vacío y el caller
+    cae a la vía Selenium/CDP.
+    """
+    sess = _load_xhr_session()
+    if not sess:
+        return []
+
+    url = _session_url_for(sess, dest_code, d)
+    try:
+        with httpx.Client(http2=True, timeout=20) as client:
+            r = client.get(url, headers=sess.get("headers", {}))
+    except Exception:
+        return []
+
+    return _payload_rows_http(r, url, d, dest_name)
+
+
+# Claves candidatas por campo; la intersección con node.keys() descarta
+# en C la gran mayoría de nodos sin evaluar ningún valor
+PRICE_KEYS = frozenset({"price", "totalPrice", "amount", "displayPrice"})
+DUR_KEYS = frozenset({"duration", "durationMinutes", "legDurationMinutes", "elapsedTime"})
+STOP_KEYS = frozenset({"stops", "stopCount", "numberOfStops", "stopsText"})
+
+# Orden de prioridad cuando un nodo trae varias claves candidatas
+_PRICE_ORDER = ("price", "totalPrice", "amount", "displayPrice")
+_DUR_ORDER = ("duration", "durationMinutes", "legDurationMinutes", "elapsedTime")
+_STOP_ORDER = ("stops", "stopCount", "numberOfStops", "stopsText")
+
+# Filas ya extraídas por payload, clave (url, hash, día, destino).
+# En los reintentos Kayak repite los mismos XHR: así no se re-recorre el árbol.
+_PAYLOAD_ROWS_CACHE: "OrderedDict[Tuple[str, str, str, str], List[Dict[str, Any]]]" = OrderedDict()
+_PAYLOAD_CACHE_MAX = 256
+
+
+def _rows_from_payload(data: Any, d: date, dest_name: str) -> List[Dict[str, Any]]:
+    """Recorre un payload JSON con pila explícita y devuelve sus filas de vuelo"""
     flights = []
-    
-    # Selectores actualizados para Kayak 2026
-    selectores_tarjetas = [
-        "div[class*='result']",
-        "div[class*='flight']",
-        "div[data-resultid]",
-        "li[class*='flight']",
-        "div[class*='nrc6']",  # Clase común en Kayak
-        "div[class*='Flights-Results'] div[class*='result']",
-        "div[role='listitem']"
-    ]
-    
-    cards = []
-    for selector in selectores_tarjetas:
-        cards = driver.find_elements(By.CSS_SELECTOR, selector)
-        if len(cards) > 3:
-            print(f"  Encontradas {len(cards)} tarjetas con selector: {selector}")
+    seen = set()
+    stack = deque([data])
+
+    while stack:
+        node = stack.pop()
+
+        if isinstance(node, list):
+            stack.extend(node)
+            continue
+        if not isinstance(node, dict):
+            continue
+
+        # Solo apilamos contenedores: los escalares nunca llevan vuelos
+        for v in node.values():
+            if isinstance(v, (dict, list)):
+                stack.append(v)
+
+        node_keys = node.keys()
+        price_keys = node_keys & PRICE_KEYS
+        if not price_keys:
+            continue
+        dur_keys = node_keys & DUR_KEYS
+        if not dur_keys:
+            continue
+        stop_keys = node_keys & STOP_KEYS
+
+        price_val = node[next(k for k in _PRICE_ORDER if k in price_keys)]
+        dur_val = node[next(k for k in _DUR_ORDER if k in dur_keys)]
+        stops_val = node[next(k for k in _STOP_ORDER if k in stop_keys)] if stop_keys else None
+
+        if price_val is None or dur_val is None:
+            continue
+
+        try:
+            price = parse_price(price_val) if isinstance(price_val, str) else float(price_val)
+            duration = (parse_duration_to_minutes(dur_val)
+                        if isinstance(dur_val, str) else int(dur_val))
+            if stops_val is None:
+                stops = 0
+            else:
+                stops = parse_stops(stops_val) if isinstance(stops_val, str) else int(stops_val)
+        except (ValueError, TypeError):
+            continue
+
+        if price <= 0 or duration <= 0:
+            continue
+
+        # Dedup en línea: ni segunda pasada ni lista transitoria con repetidos
+        key = (price, duration)
+        if key in seen:
+            continue
+        seen.add(key)
+
+        flights.append({
+            "date": d.isoformat(),
+            "destination": dest_name,
+            "price": price,
+            "duration_minutes": duration,
+            "stops": stops,
+        })
+
+    return flights
+
+
+def extract_flights_from_payloads(payloads: List[Tuple[str, str, Any]], d: date,
+                                  dest_name: str, limit: int) -> List[Dict[str, Any]]:
+    """Extrae vuelos de los JSON capturados por red, con caché por payload"""
+    flights = []
+    seen = set()  # compartido entre payloads: el duplicado cae a la primera
+
+    for url, body_hash, data in payloads:
+        cache_key = (url, body_hash, d.isoformat(), dest_name)
+        rows = _PAYLOAD_ROWS_CACHE.get(cache_key)
+        if rows is None:
+            rows = _rows_from_payload(data, d, dest_name)
+            _PAYLOAD_ROWS_CACHE[cache_key] = rows
+            if len(_PAYLOAD_ROWS_CACHE) > _PAYLOAD_CACHE_MAX:
+                _PAYLOAD_ROWS_CACHE.popitem(last=False)
+        else:
+            _PAYLOAD_ROWS_CACHE.move_to_end(cache_key)
+
+        for f in rows:
+            key = (f["price"], f["duration_minutes"])
+            if key in seen:
+                continue
+            seen.add(key)
+            flights.append(f)
+
+    return flights
+
+
+# ----------------------------
+# Extracción desde DOM (fallback)
+# ----------------------------
+# Selectores actualizados para Kayak 2026
+CARD_SELECTORS = [
+    "div[class*='result']",
+    "div[class*='flight']",
+    "div[data-resultid]",
+    "li[class*='flight']",
+    "div[class*='nrc6']",  # Clase común en Kayak
+    "div[class*='Flights-Results'] div[class*='result']",
+    "div[role='listitem']",
+]
+
+# Selector único equivalente, para esperas por número de tarjetas
+CARD_SEL = ", ".join(CARD_SELECTORS)
+
+# Recorre las tarjetas dentro de la página y devuelve los tres textos por
+# tarjeta de una vez: un único round-trip en lugar de ~15 find_element por
+# tarjeta. `startIdx` permite pasadas incrementales: tras un scroll solo se
+# leen los nodos aún no parseados, y `n` (índice donde paró el bucle) le
+# dice al caller por dónde seguir — no el total de tarjetas, que saltaría
+# las que quedaron fuera por el tope por pasada
+_DOM_EXTRACT_JS = r"""(function(cardSels, startIdx, maxCards){
+    var cards = [];
+    for (var i = 0; i < cardSels.length; i++) {
+        cards = document.querySelectorAll(cardSels[i]);
+        if (cards.length > 3) break;
+    }
+    var out = [];
+    for (var j = startIdx; j < cards.length && out.length < maxCards; j++) {
+        var c = cards[j];
+        var q = function(sel){
+            var e = c.querySelector(sel);
+            return e ? (e.innerText || e.textContent || "") : "";
+        };
+        var priceTxt = q("[class*='price'],[data-testid*='price'],[aria-label*='precio']");
+        if (priceTxt.indexOf("\u20ac") < 0) {
+            var m = (c.innerText || "").match(/[\d.,]+\s*\u20ac/);
+            priceTxt = m ? m[0] : "";
+        }
+        out.push({
+            p: priceTxt,
+            d: q("[class*='duration'],[data-testid*='duration']"),
+            s: q("[class*='stops'],[data-testid*='stops']")
+        });
+    }
+    return JSON.stringify({n: j, cards: out});
+})(%s, %d, %d)"""
+
+
+# Umbral a partir del cual el parseo vectorizado gana al bucle escalar
+_VECTORIZE_MIN_CARDS = 64
+
+# Tope de tarjetas leídas por pasada: acota la serialización del JS sin
+# impedir lotes grandes (leer innerText en la página es casi gratis)
+_DOM_MAX_CARDS_PER_PASS = 200
+
+
+def _parse_cards_vectorized(cards: List[Dict[str, str]], d: date, dest_name: str,
+                            limit: int, seen: set) -> List[Dict[str, Any]]:
+    """Parsea un lote grande de tarjetas con ops .str de pandas (regex en C)"""
+    raw = pd.DataFrame(cards)
+
+    price = (raw["p"].str.replace(" ", " ", regex=False)
+                     .str.replace(".", "", regex=False)
+                     .str.replace(",", ".", regex=False)
+                     .str.extract(r"([\d.]+)", expand=False)
+                     .astype(float))
+
+    h = raw["d"].str.extract(r"(\d+)\s*h", expand=False).fillna(0).astype(int)
+    m = raw["d"].str.extract(r"(\d+)\s*m", expand=False).fillna(0).astype(int)
+    dur = (h * 60 + m).where(h * 60 + m > 0, 120)
+
+    direct = raw["s"].str.contains("direct|nonstop|sin escalas|directo|0",
+                                   case=False, regex=True)
+    stops_num = raw["s"].str.extract(r"(\d+)", expand=False).astype(float)
+    stops = np.where(direct.fillna(True), 0, stops_num.fillna(0)).astype(int)
+
+    out = pd.DataFrame({
+        "date": d.isoformat(),
+        "destination": dest_name,
+        "price": price,
+        "duration_minutes": dur,
+        "stops": stops,
+    })
+    valid = raw["p"].str.contains("€", regex=False) & price.notna() & (price > 0)
+    out = out[valid].drop_duplicates(subset=["price", "duration_minutes"])
+
+    rows = []
+    for rec in out.to_dict("records"):
+        key = (rec["price"], rec["duration_minutes"])
+        if key in seen:
+            continue
+        seen.add(key)
+        rows.append(rec)
+        if len(rows) >= limit:
             break
-    
-    if not cards:
-        # Intentar por XPath como fallback
-        cards = driver.find_elements(By.XPATH, "//div[contains(@class, 'result') or contains(@class, 'flight')]")
-    
-    print(f"  Procesando {min(len(cards), limit*2)} tarjetas...")
-    
-    for idx, card in enumerate(cards[:limit*2]):  # Procesar más de las necesarias
+    return rows
+
+
+def extract_flights_from_dom(cdp: CDPSession, driver, d: date, dest_name: str,
+                             limit: int, seen: Optional[set] = None,
+                             start_idx: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+    """Extrae vuelos del DOM con una sola ejecución JS en la página
+
+    `seen` es el conjunto de claves (precio, duración) ya vistas; el caller
+    lo comparte entre pasadas de scroll para que cada duplicado caiga a la
+    primera sin re-escanear la lista de vuelos. `start_idx` salta las
+    tarjetas ya parseadas en pasadas anteriores; se devuelve
+    (vuelos, índice de la primera tarjeta sin parsear) para encadenar
+    la siguiente pasada.
+    """
+    if seen is None:
+        seen = set()
+    js = _DOM_EXTRACT_JS % (json.dumps(CARD_SELECTORS), start_idx,
+                            _DOM_MAX_CARDS_PER_PASS)
+    try:
+        res = cdp.command("Runtime.evaluate", {"expression": js, "returnByValue": True})
+        raw = (res.get("result") or {}).get("value")
+    except Exception:
+        # Mismo snippet vía Selenium si el socket CDP se ha caído:
+        # sigue siendo un único round-trip
+        try:
+            raw = driver.execute_script("return " + js)
+        except Exception as e:
+            print(f"  Error leyendo tarjetas del DOM: {e}")
+            return [], start_idx
+    try:
+        data = json.loads(raw or "{}")
+    except ValueError:
+        return [], start_idx
+    cards = data.get("cards", [])
+    total = data.get("n", start_idx)
+
+    print(f"  Procesando {len(cards)} tarjetas nuevas...")
+
+    # En lotes grandes, parsear por columnas en vez de por tarjeta
+    if len(cards) >= _VECTORIZE_MIN_CARDS:
+        return _parse_cards_vectorized(cards, d, dest_name, limit, seen), total
+
+    flights = []
+    for card in cards:
         if len(flights) >= limit:
             break
-            
+
         try:
-            # Scroll a la tarjeta
-            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", card)
-            time.sleep(0.3)
-            
-            # Buscar precio - múltiples selectores
-            precio = None
-            selectores_precio = [
-                ".//div[contains(text(), '€')]",
-                ".//span[contains(text(), '€')]",
-                ".//*[contains(@class, 'price')]",
-                ".//*[contains(@aria-label, 'precio')]",
-                ".//*[@data-testid='price']"
-            ]
-            
-            for sel in selectores_precio:
-                try:
-                    elem = card.find_element(By.XPATH, sel)
-                    text = elem.text
-                    if '€' in text:
-                        precio = parse_price(text)
-                        break
-                except:
-                    continue
-            
-            if not precio:
+            if "€" not in card.get("p", ""):
                 continue
-            
-            # Buscar duración
-            duracion = None
-            selectores_duracion = [
-                ".//div[contains(@class, 'duration')]",
-                ".//span[contains(@class, 'duration')]",
-                ".//div[contains(text(), 'h')]",
-                ".//*[@data-testid='duration']"
-            ]
-            
-            for sel in selectores_duracion:
-                try:
-                    elem = card.find_element(By.XPATH, sel)
-                    duracion = parse_duration_to_minutes(elem.text)
-                    break
-                except:
-                    continue
-            
-            if not duracion:
-                duracion = 120  # valor por defecto
-            
-            # Buscar escalas
-            stops = 0
-            selectores_escalas = [
-                ".//div[contains(@class, 'stops')]",
-                ".//span[contains(@class, 'stops')]",
-                ".//*[contains(text(), 'escala')]",
-                ".//*[contains(text(), 'directo')]",
-                ".//*[@data-testid='stops']"
-            ]
-            
-            for sel in selectores_escalas:
-                try:
-                    elem = card.find_element(By.XPATH, sel)
-                    stops = parse_stops(elem.text)
-                    break
-                except:
-                    continue
-            
-            flight = {
-                "date": d.isoformat(),
-                "destination": dest_name,
-                "price": precio,
-                "duration_minutes": duracion,
-                "stops": stops
-            }
-            
-            # Evitar duplicados
-            if not any(f["price"] == precio and f["duration_minutes"] == duracion for f in flights):
-                flights.append(flight)
-                print(f"    Vuelo {len(flights)}: {precio}€ - {duracion}min - {stops} escalas")
-                
-        except Exception as e:
+            precio = parse_price(card["p"])
+            duracion = parse_duration_to_minutes(card["d"]) if card.get("d") else 120
+            stops = parse_stops(card["s"]) if card.get("s") else 0
+        except (ValueError, TypeError):
             continue
-    
-    return flights
+
+        if not precio:
+            continue
+
+        # Evitar duplicados
+        key = (precio, duracion)
+        if key in seen:
+            continue
+        seen.add(key)
+        flights.append({
+            "date": d.isoformat(),
+            "destination": dest_name,
+            "price": precio,
+            "duration_minutes": duracion,
+            "stops": stops
+        })
+        print(f"    Vuelo {len(flights)}: {precio}€ - {duracion}min - {stops} escalas")
+
+    return flights, total
 
 
 # ----------------------------
 # Core scrape logic
 # ----------------------------
-def scrape_day_destination(driver, d: date, dest_name: str, dest_code: str) -> List[Dict[str, Any]]:
+def _cache_path(dest_code: str, d: date) -> str:
+    return os.path.join(CACHE_DIR, f"{ORIGIN}_{dest_code}_{d.isoformat()}.json")
+
+
+def _load_cached_rows(dest_code: str, d: date) -> Optional[List[Dict[str, Any]]]:
+    """Devuelve los vuelos cacheados si existen y no han caducado"""
+    if not USE_CACHE:
+        return None
+    path = _cache_path(dest_code, d)
+    try:
+        if time.time() - os.path.getmtime(path) > CACHE_TTL_SECONDS:
+            return None
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_cached_rows(dest_code: str, d: date, rows: List[Dict[str, Any]]) -> None:
+    """Guarda los vuelos de un (día, destino) para runs posteriores"""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(_cache_path(dest_code, d), "w") as fh:
+            json.dump(rows, fh)
+    except OSError:
+        pass  # el caché es solo una optimización
+
+
+def scrape_day_destination(driver, cdp: CDPSession, d: date, dest_name: str,
+                           dest_code: str) -> List[Dict[str, Any]]:
     """Scrapea vuelos para un día y destino específicos"""
+    # Lo más barato: reusar un scrape reciente del mismo (día, destino)
+    cached = _load_cached_rows(dest_code, d)
+    if cached is not None and len(cached) >= MIN_FLIGHTS_PER_DAY:
+        print(f"  ✓ {len(cached)} vuelos desde caché para {dest_name} - {d}")
+        return cached[:MIN_FLIGHTS_PER_DAY]
+
+    # Vía más rápida de todas: replay HTTP del XHR capturado, sin renderizar nada
+    flights = fetch_day_destination_http(d, dest_name, dest_code)
+    if len(flights) >= MIN_FLIGHTS_PER_DAY:
+        print(f"  ✓ {len(flights)} vuelos vía HTTP directo para {dest_name} - {d}")
+        _save_cached_rows(dest_code, d, flights[:MIN_FLIGHTS_PER_DAY])
+        return flights[:MIN_FLIGHTS_PER_DAY]
+
     url = build_url(ORIGIN, dest_code, d)
-    
+
     try:
         print(f"\n→ Accediendo a {url}")
-        driver.get(url)
+        # Page.navigate directo: más ligero que driver.get (no espera carga completa)
+        cdp.command("Page.navigate", {"url": url}, timeout=45)
     except Exception as e:
         print(f"Error cargando URL: {e}")
-        # Recrear driver si es necesario
         return []
-    
-    # Aceptar cookies
-    accept_cookies_kayak(driver)
-    
-    # Esperar a que cargue la página
-    time.sleep(5)
-    
-    # Esperar a que aparezca algún elemento de resultado
+
+    # Esperar al DOM (no un sleep fijo: suele estar listo mucho antes)
     try:
-        WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.XPATH, "//*[contains(text(), '€')]"))
-        )
+        WebDriverWait(driver, 10, poll_frequency=0.25).until(
+            lambda drv: drv.execute_script("return document.readyState") != "loading")
     except TimeoutException:
-        print("  Timeout esperando precios, continuando...")
-    
+        pass
+    accept_cookies_kayak(cdp)
+
+    # Vía principal: capturar los XHR de resultados por red
+    # (corta sola en cuanto tiene MIN_FLIGHTS_PER_DAY vuelos extraíbles)
+    _, flights = collect_network_json(cdp, d, dest_name, seconds=12.0)
+
+    if len(flights) >= MIN_FLIGHTS_PER_DAY:
+        print(f"  ✓ {len(flights)} vuelos por red para {dest_name} - {d}")
+        _save_cached_rows(dest_code, d, flights[:MIN_FLIGHTS_PER_DAY])
+        return flights[:MIN_FLIGHTS_PER_DAY]
+
+    print(f"  Red insuficiente ({len(flights)}), cayendo a extracción DOM...")
+
+    # Esperar a resultados concretos: primero algún precio, luego tarjetas
+    # (chequeo JS en vez de XPath: querySelectorAll/innerText nativos del motor)
+    try:
+        WebDriverWait(driver, 15, poll_frequency=0.25).until(
+            lambda drv: drv.execute_script(
+                "return document.body.innerText.indexOf('\u20ac') !== -1"))
+        WebDriverWait(driver, 10, poll_frequency=0.25).until(
+            lambda drv: len(drv.find_elements(By.CSS_SELECTOR, CARD_SEL)) >= MIN_FLIGHTS_PER_DAY)
+    except TimeoutException:
+        print("  Timeout esperando resultados, continuando...")
+
     # Scroll gradual para cargar más resultados
-    flights = []
     scroll_attempts = 0
     max_scrolls = 5
-    
+
+    # Claves ya vistas y última tarjeta parseada, compartidas entre pasadas:
+    # cada pasada solo lee y parsea los nodos añadidos tras el último scroll
+    seen = {(f["price"], f["duration_minutes"]) for f in flights}
+    last_idx = 0
+
     while len(flights) < MIN_FLIGHTS_PER_DAY and scroll_attempts < max_scrolls:
-        # Extraer vuelos actuales
-        new_flights = extract_flights_from_dom(driver, d, dest_name, MIN_FLIGHTS_PER_DAY)
-        
-        # Añadir nuevos vuelos sin duplicados
-        existing_prices = {(f["price"], f["duration_minutes"]) for f in flights}
-        for f in new_flights:
-            key = (f["price"], f["duration_minutes"])
-            if key not in existing_prices and f["price"] > 0:
-                flights.append(f)
-                existing_prices.add(key)
-        
+        # Extraer solo las tarjetas nuevas desde la pasada anterior
+        new_flights, last_idx = extract_flights_from_dom(
+            cdp, driver, d, dest_name, MIN_FLIGHTS_PER_DAY, seen, last_idx)
+        flights.extend(new_flights)
+
         print(f"  Intentos: {scroll_attempts+1}, Vuelos: {len(flights)}/{MIN_FLIGHTS_PER_DAY}")
-        
+
         if len(flights) < MIN_FLIGHTS_PER_DAY:
-            # Scroll hacia abajo gradual
+            # Scroll hacia abajo gradual, esperando a que aparezcan tarjetas
+            # nuevas en vez de dormir un tiempo fijo
+            prev_count = len(driver.find_elements(By.CSS_SELECTOR, CARD_SEL))
             scroll_height = 300 * (scroll_attempts + 1)
             driver.execute_script(f"window.scrollBy(0, {scroll_height});")
-            time.sleep(2)
+            try:
+                WebDriverWait(driver, 5, poll_frequency=0.25).until(
+                    lambda drv: len(drv.find_elements(By.CSS_SELECTOR, CARD_SEL)) > prev_count)
+            except TimeoutException:
+                pass
             scroll_attempts += 1
-    
+
     if len(flights) >= MIN_FLIGHTS_PER_DAY:
         print(f"  ✓ {len(flights)} vuelos obtenidos para {dest_name} - {d}")
+        _save_cached_rows(dest_code, d, flights[:MIN_FLIGHTS_PER_DAY])
         return flights[:MIN_FLIGHTS_PER_DAY]
     else:
         print(f"  ✗ Solo {len(flights)} vuelos obtenidos para {dest_name} - {d}")
         return flights  # Devolver los que tenemos
 
 
+# Driver local de cada proceso del pool (Selenium no es thread-safe).
+# El contador compartido reparte índices de slot estables (0, 1, 2...):
+# a diferencia del pid, el slot N apunta al mismo perfil en cada run
+_SLOT_COUNTER = multiprocessing.Value("i", 0)
+_WORKER_DRIVER = None
+_WORKER_CDP = None
+_WORKER_SLOT = None
+
+
+def _close_worker():
+    """Cierra el Chrome del worker cuando muere su proceso"""
+    if _WORKER_CDP is not None:
+        _WORKER_CDP.close()
+    if _WORKER_DRIVER is not None:
+        try:
+            _WORKER_DRIVER.quit()
+        except Exception:
+            pass
+
+
+def _init_worker():
+    """Crea un Chrome propio para cada proceso del pool"""
+    global _WORKER_DRIVER, _WORKER_CDP, _WORKER_SLOT
+    if _WORKER_SLOT is None:
+        with _SLOT_COUNTER.get_lock():
+            _WORKER_SLOT = _SLOT_COUNTER.value
+            _SLOT_COUNTER.value += 1
+    _WORKER_DRIVER = make_driver(_WORKER_SLOT)
+    _WORKER_CDP = attach_cdp(_WORKER_DRIVER)
+    atexit.register(_close_worker)
+
+
+def _scrape_task(task):
+    """Ejecuta un (día, destino) con el driver local del proceso"""
+    global _WORKER_DRIVER, _WORKER_CDP
+    d, dest_name, dest_code = task
+
+    try:
+        rows = scrape_day_destination(_WORKER_DRIVER, _WORKER_CDP, d, dest_name, dest_code)
+    except NoSuchWindowException:
+        print("Ventana cerrada, recreando driver...")
+        _WORKER_CDP.close()
+        _WORKER_DRIVER.quit()
+        _init_worker()
+        rows = scrape_day_destination(_WORKER_DRIVER, _WORKER_CDP, d, dest_name, dest_code)
+    except Exception as e:
+        print(f"Error inesperado: {e}")
+        return []
+
+    # Pausa corta por worker: cada proceso tiene su propio perfil/cookies
+    time.sleep(0.5)
+    return rows
+
+
+def write_csv(df: pd.DataFrame, path: str) -> None:
+    """Escribe un CSV con el writer C de pyarrow si está instalado"""
+    if pa is not None:
+        pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
+    else:
+        df.to_csv(path, index=False)
+
+
+def write_svg_charts(pivot, summary) -> None:
+    """Emite los dos gráficos como SVG escribiendo el markup a mano
+
+    Mucho más barato que matplotlib (sin importar el backend ni crear
+    figuras); los PNG del entregable se generan aparte.
+    """
+    w, h, pad = 900, 450, 60
+    colors = ("#1f77b4", "#ff7f0e", "#2ca02c")
+
+    # price_trend.svg: una polyline por destino
+    ymax = float(np.nanmax(pivot.values)) * 1.1 if len(pivot) else 1.0
+    n = len(pivot.index)
+    xstep = (w - 2 * pad) / max(n - 1, 1)
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{w}" height="{h}">',
+        f'<text x="{w / 2}" y="25" text-anchor="middle" font-weight="bold" '
+        f'font-family="sans-serif">Tendencia de Precios por Destino</text>',
+    ]
+    for ci, dest in enumerate(pivot.columns):
+        color = colors[ci % len(colors)]
+        pts = " ".join(
+            f"{pad + i * xstep:.1f},{h - pad - (v / ymax) * (h - 2 * pad):.1f}"
+            for i, v in enumerate(pivot[dest].values) if v == v  # NaN fuera
+        )
+        parts.append(f'<polyline points="{pts}" fill="none" stroke="{color}" stroke-width="2"/>')
+        parts.append(f'<text x="{w - pad + 5}" y="{30 + 18 * ci}" fill="{color}" '
+                     f'font-family="sans-serif" font-size="12">{dest}</text>')
+    parts.append("</svg>")
+    with open("price_trend.svg", "w") as fh:
+        fh.write("".join(parts))
+
+    # score_comparison.svg: barras (menor = mejor)
+    smax = float(summary["final_score"].max()) * 1.1 if len(summary) else 1.0
+    bw = (w - 2 * pad) / max(len(summary), 1)
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{w}" height="{h}">',
+        f'<text x="{w / 2}" y="25" text-anchor="middle" font-weight="bold" '
+        f'font-family="sans-serif">Puntuación Final por Destino (menor = mejor)</text>',
+    ]
+    for i, row in enumerate(summary.itertuples(index=False)):
+        bh = (row.final_score / smax) * (h - 2 * pad)
+        x = pad + i * bw + bw * 0.1
+        y = h - pad - bh
+        color = colors[i % len(colors)]
+        parts.append(f'<rect x="{x:.1f}" y="{y:.1f}" width="{bw * 0.8:.1f}" '
+                     f'height="{bh:.1f}" fill="{color}" stroke="black"/>')
+        parts.append(f'<text x="{x + bw * 0.4:.1f}" y="{y - 5:.1f}" text-anchor="middle" '
+                     f'font-family="sans-serif" font-size="12">{row.final_score:.1f}</text>')
+        parts.append(f'<text x="{x + bw * 0.4:.1f}" y="{h - pad + 18}" text-anchor="middle" '
+                     f'font-family="sans-serif" font-size="12">{row.destination}</text>')
+    parts.append("</svg>")
+    with open("score_comparison.svg", "w") as fh:
+        fh.write("".join(parts))
+
+
 def main():
     """Función principal"""
     print("=" * 60)
@@ -350,146 +1143,161 @@ def main():
     print(f"Destinos: {', '.join(DESTS.keys())}")
     print(f"Mínimo vuelos por día/destino: {MIN_FLIGHTS_PER_DAY}")
     print("=" * 60)
-    
-    driver = None
-    all_rows = []
-    
-    try:
-        driver = make_driver()
-        d = START
-        
-        while d <= END:
-            print(f"\n--- DÍA: {d.strftime('%d/%m/%Y')} ---")
-            
-            for dest_name, dest_code in DESTS.items():
-                try:
-                    rows = scrape_day_destination(driver, d, dest_name, dest_code)
-                    all_rows.extend(rows)
-                    
-                    # Pausa variable
-                    time.sleep(2)
-                    
-                except NoSuchWindowException:
-                    print("Ventana cerrada, recreando driver...")
-                    driver.quit()
-                    driver = make_driver()
-                    time.sleep(3)
-                    # Reintentar el mismo destino
-                    rows = scrape_day_destination(driver, d, dest_name, dest_code)
+
+    # Todas las combinaciones (día, destino): cada una es independiente
+    dates = [START + timedelta(days=i) for i in range((END - START).days + 1)]
+    tasks = [(d, dest_name, dest_code)
+             for d in dates
+             for dest_name, dest_code in DESTS.items()]
+
+    # Fase 1: replay HTTP concurrente de todo el lote, si hay sesión capturada
+    http_results = asyncio.run(fetch_all_http(tasks))
+    all_rows = [r for rows in http_results.values() for r in rows]
+    if http_results:
+        print(f"✓ {len(http_results)}/{len(tasks)} tareas resueltas vía HTTP directo")
+    tasks = [t for t in tasks if t not in http_results]
+
+    # Fase 2: lo que falte, con el pool de navegadores
+    if tasks:
+        max_workers = min(len(tasks), os.cpu_count() or 4)
+        print(f"Lanzando {max_workers} procesos en paralelo para {len(tasks)} tareas...")
+
+        try:
+            with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=max_workers, initializer=_init_worker) as pool:
+                for rows in pool.map(_scrape_task, tasks):
                     all_rows.extend(rows)
-                    
-                except Exception as e:
-                    print(f"Error inesperado: {e}")
-                    continue
-            
-            d += timedelta(days=1)
-    
-    except KeyboardInterrupt:
-        print("\nProceso interrumpido por usuario")
-    
-    finally:
-        if driver:
-            driver.quit()
-    
+
+        except KeyboardInterrupt:
+            print("\nProceso interrumpido por usuario")
+
     # ----------------------------
     # Verificar y guardar datos
     # ----------------------------
     if not all_rows:
         print("No se obtuvieron datos")
         return
-    
-    df = pd.DataFrame(all_rows)
-    
+
+    # Columnas tipadas (SoA) en vez de dejar a pandas inferir fila a fila
+    # sobre la lista de dicts: price queda en float64, duración/escalas en enteros
+    df = pd.DataFrame({
+        "date": np.array([r["date"] for r in all_rows], dtype=object),
+        "destination": np.array([r["destination"] for r in all_rows], dtype=object),
+        "price": np.array([r["price"] for r in all_rows], dtype=np.float64),
+        "duration_minutes": np.array([r["duration_minutes"] for r in all_rows], dtype=np.int32),
+        "stops": np.array([r["stops"] for r in all_rows], dtype=np.int8),
+    })
+
     # Verificar columnas
     expected_cols = ["date", "destination", "price", "duration_minutes", "stops"]
     for col in expected_cols:
         if col not in df.columns:
             print(f"Error: Falta columna {col}")
             return
-    
+
     # Eliminar duplicados y nulos
     df = df.drop_duplicates()
     df = df.dropna()
-    
+
+    # Compactar dtypes: float32/int16/int8 y categoría bastan de sobra para
+    # precios, duraciones y escalas, y la serialización va sobre menos bytes
+    df = df.astype({
+        "price": "float32",
+        "duration_minutes": "int16",
+        "stops": "int8",
+        "destination": "category",
+    })
+
     # Guardar flights.csv
-    df.to_csv("flights.csv", index=False)
+    write_csv(df, "flights.csv")
     print(f"\n✓ flights.csv guardado con {len(df)} registros")
-    
-    # Calcular estadísticas
+
+    # Calcular estadísticas (todo por rutas C de pandas: sin lambdas por grupo)
+    df["is_direct"] = (df["stops"].values == 0).astype(np.uint8)
     summary = df.groupby("destination", as_index=False).agg(
         avg_price=("price", "mean"),
         std_price=("price", "std"),
         min_price=("price", "min"),
         avg_duration=("duration_minutes", "mean"),
-        direct_ratio=("stops", lambda s: (s == 0).mean()),
+        direct_ratio=("is_direct", "mean"),
     )
-    
+
     # Redondear
     for col in ["avg_price", "std_price", "min_price", "avg_duration", "direct_ratio"]:
         summary[col] = summary[col].round(2)
-    
+
     # Fórmula obligatoria
     summary["final_score"] = (
-        (summary["avg_price"] * 0.5) + 
-        (summary["avg_duration"] * 0.3) + 
+        (summary["avg_price"] * 0.5) +
+        (summary["avg_duration"] * 0.3) +
         (summary["std_price"] * 0.2)
     ).round(2)
-    
+
     summary = summary.sort_values("final_score", ascending=True)
-    summary.to_csv("summary.csv", index=False)
+    write_csv(summary, "summary.csv")
     print("✓ summary.csv guardado")
-    
+
     # ----------------------------
     # Gráficos
     # ----------------------------
+    trend = df.groupby(["date", "destination"])["price"].mean().reset_index()
+    pivot = trend.pivot(index="date", columns="destination", values="price").sort_index()
+    best_dest = summary.iloc[0]["destination"]
+
+    # SVG directo: disponible aunque matplotlib falle o no esté instalado
     try:
-        # Price trend
-        plt.figure(figsize=(12, 6))
-        trend = df.groupby(["date", "destination"])["price"].mean().reset_index()
-        
-        for dest in trend["destination"].unique():
-            dest_data = trend[trend["destination"] == dest].sort_values("date")
-            plt.plot(dest_data["date"], dest_data["price"], marker='o', label=dest, linewidth=2)
-        
-        plt.title("Tendencia de Precios por Destino", fontsize=14, fontweight='bold')
-        plt.xlabel("Fecha")
-        plt.ylabel("Precio Medio (€)")
-        plt.legend()
-        plt.xticks(rotation=45)
-        plt.grid(True, alpha=0.3)
-        plt.tight_layout()
-        plt.savefig("price_trend.png", dpi=150)
-        plt.close()
+        write_svg_charts(pivot, summary)
+        print("✓ price_trend.svg / score_comparison.svg guardados")
+    except Exception as e:
+        print(f"Error generando SVG: {e}")
+
+    try:
+        # PNG (entregable del challenge): matplotlib se importa solo aquí,
+        # fuera del arranque de los workers del pool
+        import matplotlib
+        matplotlib.use("Agg")  # backend sin GUI: no hace falta servidor X
+        import matplotlib.pyplot as plt
+
+        fig, ax = plt.subplots(figsize=(12, 6))
+        ax.plot(pivot.index.values, pivot.values, marker='o', linewidth=2)
+        ax.legend(pivot.columns)
+        ax.set_title("Tendencia de Precios por Destino", fontsize=14, fontweight='bold')
+        ax.set_xlabel("Fecha")
+        ax.set_ylabel("Precio Medio (€)")
+        ax.tick_params(axis='x', rotation=45)
+        ax.grid(True, alpha=0.3)
+        fig.tight_layout()
+        fig.savefig("price_trend.png", dpi=100)
+        plt.close(fig)
         print("✓ price_trend.png guardado")
-        
+
         # Score comparison
-        plt.figure(figsize=(10, 6))
+        fig, ax = plt.subplots(figsize=(10, 6))
         colors = plt.cm.RdYlGn_r([0.2, 0.5, 0.8])
-        bars = plt.bar(summary["destination"], summary["final_score"], color=colors, edgecolor='black')
-        
+        bars = ax.bar(summary["destination"], summary["final_score"], color=colors, edgecolor='black')
+
         for bar in bars:
             height = bar.get_height()
-            plt.text(bar.get_x() + bar.get_width()/2., height,
+            ax.text(bar.get_x() + bar.get_width()/2., height,
                     f'{height:.1f}', ha='center', va='bottom', fontweight='bold')
-        
-        plt.title("Puntuación Final por Destino (menor = mejor)", fontsize=14, fontweight='bold')
-        plt.xlabel("Destino")
-        plt.ylabel("Final Score")
-        plt.grid(True, alpha=0.3, axis='y')
-        
-        best_dest = summary.iloc[0]["destination"]
-        plt.figtext(0.5, -0.15, f'🏆 MEJOR DESTINO: {best_dest} 🏆', 
-                   fontsize=14, fontweight='bold', ha='center',
-                   bbox=dict(boxstyle='round', facecolor='gold', alpha=0.3))
-        
-        plt.tight_layout()
-        plt.savefig("score_comparison.png", dpi=150)
-        plt.close()
+
+        ax.set_title("Puntuación Final por Destino (menor = mejor)", fontsize=14, fontweight='bold')
+        ax.set_xlabel("Destino")
+        ax.set_ylabel("Final Score")
+        ax.grid(True, alpha=0.3, axis='y')
+
+        fig.text(0.5, -0.15, f'🏆 MEJOR DESTINO: {best_dest} 🏆',
+                 fontsize=14, fontweight='bold', ha='center',
+                 bbox=dict(boxstyle='round', facecolor='gold', alpha=0.3))
+
+        fig.tight_layout()
+        fig.savefig("score_comparison.png", dpi=100)
+        plt.close(fig)
         print("✓ score_comparison.png guardado")
-        
+
     except Exception as e:
         print(f"Error generando gráficos: {e}")
-    
+
     # ----------------------------
     # Resultados
     # ----------------------------
@@ -498,17 +1306,17 @@ def main():
     print("=" * 50)
     print(summary.to_string(index=False))
     print(f"\n🏆 GANADOR: {best_dest} 🏆")
-    
+
     # Verificar requisitos
     print("\n" + "=" * 50)
     print("VERIFICACIÓN DE REQUISITOS")
     print("=" * 50)
-    
+
     dias_unicos = df["date"].nunique()
     destinos_unicos = df["destination"].nunique()
     min_vuelos = df.groupby(["date", "destination"]).size().min()
     nulos = df.isnull().sum().sum()
-    
+
     print(f"Días completos: {dias_unicos}/8 {'✓' if dias_unicos == 8 else '✗'}")
     print(f"Destinos completos: {destinos_unicos}/3 {'✓' if destinos_unicos == 3 else '✗'}")
     print(f"Mínimo vuelos/día: {min_vuelos}/5 {'✓' if min_vuelos >= 5 else '✗'}")
@@ -516,4 +1324,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()